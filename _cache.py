@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import diskcache
+import redis
+import redis.asyncio as aioredis
+
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # optional semantic tier, see README
+    faiss = SentenceTransformer = None
+
+log = logging.getLogger("book_advisor")
+
+memory_size = 512
+cache_dir = os.getenv("RESPONSE_CACHE_DIR")  # set to keep answers across restarts
+redis_url = os.getenv("REDIS_URL")  # set to share answers across workers and replicas
+redis_timeout = 0.05  # seconds; past this Redis counts as a miss rather than slowing the request
+_REDIS_PREFIX = "book_advisor:"
+
+semantic_model = "all-MiniLM-L6-v2"
+semantic_threshold = 0.92  # cosine similarity needed to reuse another prompt's answer
+semantic_size = 1024  # the index starts over once it holds this many answers
+semantic_candidates = 8  # nearest prompts checked for one with a matching scope
+semantic_enabled = bool(os.getenv("SEMANTIC_CACHE"))
+if semantic_enabled and faiss is None:
+    log.warning("⚠️ SEMANTIC_CACHE is set but faiss-cpu / sentence-transformers aren't installed")
+    semantic_enabled = False
+
+# (expires_at, answer) by key, least recently used first
+_memory = OrderedDict()
+_disk = diskcache.Cache(cache_dir) if cache_dir else None
+_redis = aioredis.Redis.from_url(
+    redis_url, decode_responses=True, socket_timeout=redis_timeout, socket_connect_timeout=redis_timeout
+) if redis_url else None
+
+# Semantic tier: embedder loaded on first use, index rows line up with _semantic_answers
+_semantic_lock = threading.Lock()
+_embedder = None
+_index = None
+_semantic_answers = []  # (scope, expires_at, answer) per index row
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def canon(text):
+    """Fold trivial variations ("Sci-fi book?" vs "sci-fi  book") onto one cache key"""
+    text = unicodedata.normalize("NFKC", text).casefold().strip()
+    return _WHITESPACE_RE.sub(" ", text).rstrip(".?!")
+
+def make_key(**fields):
+    """Short stable key for a request's text and every parameter that shapes its answer"""
+    return hashlib.blake2b(json.dumps(fields, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+def _remember(key, text, expires_at):
+    _memory[key] = (expires_at, text)
+    _memory.move_to_end(key)
+    if len(_memory) > memory_size:
+        _memory.popitem(last=False)
+
+async def get(key):
+    """Unexpired cached answer for key, or None. Checks memory, then disk, then the shared Redis tier."""
+    if key in _memory:
+        expires_at, text = _memory[key]
+        if expires_at > time.time():
+            _memory.move_to_end(key)
+            return text
+        del _memory[key]
+    if _disk is not None:
+        text, expires_at = _disk.get(key, expire_time=True)
+        if text is not None:
+            _remember(key, text, expires_at)
+            return text
+    if _redis is not None:
+        try:
+            async with _redis.pipeline(transaction=False) as pipe:
+                text, ttl = await pipe.get(_REDIS_PREFIX + key).ttl(_REDIS_PREFIX + key).execute()
+        except (redis.RedisError, OSError) as e:  # fail open: Redis trouble is just a miss
+            log.warning("⚠️ Redis get failed: %s", e)
+            return None
+        if text is not None:
+            _remember(key, text, time.time() + ttl)
+            return text
+    return None
+
+async def put(key, text, ttl):
+    """Remember a finished answer for ttl seconds, evicting the least recently used one when full"""
+    _remember(key, text, time.time() + ttl)
+    if _disk is not None:
+        _disk.set(key, text, expire=ttl)
+    if _redis is not None:
+        try:
+            await _redis.setex(_REDIS_PREFIX + key, ttl, text)
+        except (redis.RedisError, OSError) as e:
+            log.warning("⚠️ Redis set failed: %s", e)
+
+def _embed(text):
+    global _embedder, _index
+    if _embedder is None:
+        _embedder = SentenceTransformer(semantic_model)
+        _index = faiss.IndexFlatIP(_embedder.get_sentence_embedding_dimension())
+    # Normalized vectors make inner product equal cosine similarity
+    return _embedder.encode([text], normalize_embeddings=True)
+
+def _semantic_failed(action, e):
+    """Fail open like Redis: log, count it as a miss, and give up on the tier if the model never loaded"""
+    global semantic_enabled
+    log.warning("⚠️ Semantic cache %s failed: %s", action, e)
+    if _embedder is None:  # don't retry the model download on every request
+        semantic_enabled = False
+        log.warning("⚠️ Semantic cache disabled until restart")
+
+def semantic_get(text, scope):
+    """Unexpired answer for the most similar earlier prompt with the same scope, if it's close enough.
+    Blocking - run in a thread."""
+    if not semantic_enabled:
+        return None
+    with _semantic_lock:
+        try:
+            vec = _embed(text)
+            if _index.ntotal == 0:
+                return None
+            scores, ids = _index.search(vec, min(semantic_candidates, _index.ntotal))
+        except Exception as e:  # model download/load errors come in many types
+            _semantic_failed("get", e)
+            return None
+        now = time.time()
+        # Nearest first; the parameters that shape an answer must match exactly, not just look alike
+        for score, row in zip(scores[0], ids[0]):
+            if score <= semantic_threshold:
+                break
+            row_scope, expires_at, answer = _semantic_answers[row]
+            if row_scope == scope and expires_at > now:
+                return answer
+    return None
+
+def semantic_put(text, scope, answer, ttl):
+    """Index a finished answer under its prompt's embedding for ttl seconds. Blocking - run in a thread."""
+    if not semantic_enabled:
+        return
+    with _semantic_lock:
+        try:
+            vec = _embed(text)
+        except Exception as e:
+            _semantic_failed("put", e)
+            return
+        if _index.ntotal >= semantic_size:
+            # Flat indexes can't cheaply drop their oldest rows, so a full one starts over
+            _index.reset()
+            _semantic_answers.clear()
+        _index.add(vec)
+        _semantic_answers.append((scope, time.time() + ttl, answer))
+
+async def clear():
+    """Forget every cached answer"""
+    _memory.clear()
+    if _disk is not None:
+        _disk.clear()
+    if _redis is not None:
+        try:
+            # Only our own keys - the Redis instance may be shared
+            async for key in _redis.scan_iter(match=_REDIS_PREFIX + "*"):
+                await _redis.delete(key)
+        except (redis.RedisError, OSError) as e:
+            log.warning("⚠️ Redis clear failed: %s", e)
+    with _semantic_lock:
+        if _index is not None:
+            _index.reset()
+        _semantic_answers.clear()
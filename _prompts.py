@@ -0,0 +1,52 @@
+import re
+
+# Sent as the system turn; the endpoint applies Llama-3.1's own chat template around it.
+# Keep it byte-identical between requests (no timestamps or per-user text) so the
+# server can reuse the prefill of this shared prefix.
+# Per-tab framing lives here too, so every tab shares it and only a short TASK tag differs.
+SYSTEM_PROMPT = (
+    "You are Jacob's personal book advisor, trained on the books in his personal library. "
+    "Ground every recommendation and answer in that collection.\n\n"
+    "Each request starts with a TASK tag:\n"
+    "- CHAT: talk about the library conversationally.\n"
+    "- RECOMMEND: recommend a book from the library for the given interest and explain why it would be perfect.\n"
+    "- ANSWER: answer the question based on the content of the books in the library."
+)
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Task tags explained in SYSTEM_PROMPT; the tag comes first and the user's own text last
+TASK_CHAT = "CHAT"
+TASK_RECOMMEND = "RECOMMEND"
+TASK_ANSWER = "ANSWER"
+
+# Templates bound once, so building a prompt is a single format call
+_TAGGED = "TASK: {t}\n{u}".format
+# Byte-identical leading part of every raw prompt; only the tag and user text follow it
+SYSTEM_PREFIX = SYSTEM_PROMPT + "\n\n### Instruction:\n"
+_RAW_HEAD = SYSTEM_PREFIX.replace("{", "{{").replace("}", "}}") + "TASK: {t}\n{u}"
+_RAW_WITH_INPUT = (_RAW_HEAD + "\n\n### Input:\n{inp}\n\n### Response:\n").format
+_RAW_NO_INPUT = (_RAW_HEAD + "\n\n### Response:\n").format
+
+# End generation as soon as the model starts a new Alpaca section or emits end-of-turn
+STOP_SEQUENCES = ["\n### Instruction:", "\n### Input:", "<|eot_id|>"]
+# Streaming-side stop rule for endings the server can't catch: two blank lines in a row,
+# or a new Alpaca section after some answer text (plain Markdown "###" headings are left alone)
+EARLY_STOP_RE = re.compile(r"\n[ \t]*\n[ \t]*\n|\n[ \t]*###\s*(?:Instruction|Input|Response)\b")
+# The Alpaca-tuned adapter sometimes opens its answer with the response header; drop it, keep the answer
+RESPONSE_HEADER_RE = re.compile(r"^###\s*Response:?\s*")
+
+# Classifies Hub/Inference errors into setup guidance in one case-insensitive pass
+ERROR_RE = re.compile(r"(?P<auth>401|unauthorized)|(?P<forbid>403|forbidden|gated)|(?P<notfound>404|not found)", re.I)
+
+def make_messages(task_tag, user_text, context=""):
+    """Native chat turns: shared system prompt, then the task tag, then the user's text"""
+    messages = [SYSTEM_MESSAGE, {"role": "user", "content": _TAGGED(t=task_tag, u=user_text)}]
+    if context.strip():
+        messages.append({"role": "user", "content": context})
+    return messages
+
+def build_raw_prompt(task_tag, user_text, context=""):
+    """Alpaca-style prompt the model was tuned on, for endpoints without chat support"""
+    if context.strip():
+        return _RAW_WITH_INPUT(t=task_tag, u=user_text, inp=context)
+    return _RAW_NO_INPUT(t=task_tag, u=user_text)
@@ -1,10 +1,174 @@
-import gradio as gr
-from huggingface_hub import InferenceClient
 import os
 
+app_version = "1"  # part of every cache key and the example cache path; bump when prompts or the model change
+
+# Must be set before Gradio is imported; keeps cached example answers across warm restarts
+os.environ.setdefault("GRADIO_EXAMPLES_CACHE", f"/tmp/examples_cache/v{app_version}")
+
+import gradio as gr
+from huggingface_hub import AsyncInferenceClient, InferenceTimeoutError, configure_http_backend, model_info
+from huggingface_hub.utils import HfHubHTTPError
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import requests
+import threading
+import time
+
+import _cache
+from _prompts import (
+    EARLY_STOP_RE, ERROR_RE, RESPONSE_HEADER_RE, STOP_SEQUENCES, TASK_ANSWER, TASK_CHAT, TASK_RECOMMEND,
+    build_raw_prompt, make_messages
+)
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("book_advisor")
+
 # Configuration - ONLY your trained model (merged version for Inference API)
 model_name = "jacobpmeyer/book-advisor-merged"
 hf_token = os.getenv("HF_TOKEN")
+request_timeout = 120  # seconds to wait on the Inference API per request
+max_concurrent_requests = 4  # the endpoint starts dropping connections above ~4 in flight
+queue_concurrency = 32  # handlers are coroutines, so cache hits shouldn't wait behind the semaphore
+max_queue_size = 64  # requests waiting beyond this are turned away instead of piling up
+probe_timeout = 3  # seconds; bounds how long a slow Hub can hold up startup
+probe_fatal_statuses = (401, 403, 404)  # the model check only blocks the app on these; anything else is the Hub's problem
+probe_cache_path = os.path.expanduser("~/.cache/book_advisor/client.json")
+probe_cache_ttl = 3600  # seconds a successful model check is trusted across restarts
+
+# Callers hold _sem while they submit, so a burst can never be bigger than this
+max_batch_size = max_concurrent_requests  # most requests coalesced into one burst against the endpoint
+max_batch_delay = 0.02  # seconds the batcher waits for more requests to join a burst
+uncacheable_temperature = 0.9  # answers this random aren't worth reusing at all
+factual_temperature = 0.3  # at or below, answers are stable enough to keep longer
+factual_cache_ttl = 3600  # seconds
+creative_cache_ttl = 300  # seconds
+semantic_max_temperature = 0.3  # similar-prompt reuse gives false positives on creative queries above this
+
+ready_message = "✅ Your personalized book advisor is ready!"
+min_question_chars = 3
+max_input_chars = 4000  # keeps accidental giant pastes from blowing past the context window
+
+default_max_length = 200  # on the Response Length slider's 50-token steps
+default_temperature = 0.7
+
+def _http_backend():
+    """Pooled keep-alive session for huggingface_hub's sync calls (the Hub model check)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2))
+    session.mount("https://", adapter)
+    return session
+
+configure_http_backend(backend_factory=_http_backend)
+
+# Bounds how many generations are in flight against the Inference API at once
+_sem = asyncio.Semaphore(max_concurrent_requests)
+
+# Pending Inference API calls for the batcher, created on first use inside the event loop
+_batch_queue = None
+_batch_task = None
+_background = set()  # in-flight bursts and stream cleanups
+
+# Keep-alive connection pool shared by every Inference API call, created inside the event loop
+_pool = None
+# Sessions opened by the current _call_hf attempt, so a stream's session can be closed with it
+_call_sessions = contextvars.ContextVar("_call_sessions", default=None)
+
+class _PooledInferenceClient(AsyncInferenceClient):
+    """AsyncInferenceClient whose per-call sessions all borrow the shared keep-alive pool"""
+
+    def _get_client_session(self, headers=None):
+        # huggingface_hub 0.26 opens (and afterwards closes) a fresh aiohttp session per call,
+        # which would mean a new TCP+TLS handshake every time. The session's own connector is
+        # still empty here, so it's swapped for the shared one; connector_owner=False keeps
+        # closing the session from closing the pool. _sem bounds concurrency, so the pool doesn't.
+        global _pool
+        if _pool is None or _pool.closed:
+            _pool = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+        session = super()._get_client_session(headers=headers)
+        own_connector = session._connector
+        session._connector, session._connector_owner = _pool, False
+        _keep(asyncio.ensure_future(own_connector.close()))
+        opened = _call_sessions.get()
+        if opened is not None:
+            opened.append(session)
+        return session
+
+class _ClosingStream:
+    """A streaming response whose HTTP session is closed even when the reader stops early"""
+
+    def __init__(self, stream, sessions):
+        self._stream = stream
+        self._sessions = sessions
+
+    def __aiter__(self):
+        return self._stream.__aiter__()
+
+    async def aclose(self):
+        # Closing the hub's generator alone leaves its response holding a pooled connection
+        await self._stream.aclose()
+        for session in self._sessions:
+            if not session.closed:
+                await session.close()
+
+async def _retire_pool(pool):
+    """Close a replaced pool once every request still using it must have timed out"""
+    await asyncio.sleep(request_timeout)
+    await pool.close()
+
+# Single shared client, built on first use; its calls reuse connections from _pool
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    """The shared client, constructed exactly once even when first requests race"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _PooledInferenceClient(model=model_name, token=hf_token, timeout=request_timeout)
+    return _client
+
+def _reset_client():
+    """Drop the shared client and its pool; the next request builds fresh ones"""
+    global _client, _pool
+    with _client_lock:
+        _client = None
+    if _pool is not None:
+        _keep(asyncio.create_task(_retire_pool(_pool)))
+        _pool = None
+
+def _probe_is_fresh():
+    """Whether a recent successful model check for this model is recorded on disk"""
+    try:
+        with open(probe_cache_path) as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return probe.get("model") == model_name and time.time() - probe.get("ok_at", 0) < probe_cache_ttl
+
+def _remember_probe():
+    try:
+        os.makedirs(os.path.dirname(probe_cache_path), exist_ok=True)
+        with open(probe_cache_path, "w") as f:
+            json.dump({"model": model_name, "ok_at": time.time()}, f)
+    except OSError as e:
+        log.warning("⚠️ Couldn't record model check: %s", e)
+
+def _forget_probe():
+    try:
+        os.remove(probe_cache_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:  # called from error handlers, so it must never raise itself
+        log.warning("⚠️ Couldn't clear model check: %s", e)
 
 def get_lora_client():
     """Initialize client with ONLY your LoRA model"""
@@ -12,93 +176,355 @@ def get_lora_client():
         return None, "❌ HF_TOKEN environment variable not set"
 
     try:
-        print(f"🔄 Loading your personalized model: {model_name}")
-        client = InferenceClient(model=model_name, token=hf_token)
-        
-        # Just initialize without testing - test on first actual use
-        print(f"✅ Client initialized for model: {model_name}")
-        return client, "✅ Your personalized book advisor is ready!"
+        log.info("🔄 Loading your personalized model: %s", model_name)
+        # Cheap Hub metadata lookup - confirms access without running a generation.
+        # Skipped on warm restarts when a recent check already succeeded.
+        if not _probe_is_fresh():
+            try:
+                # expand= asks only for the serving state, not the full repo metadata
+                info = model_info(model_name, token=hf_token, timeout=probe_timeout, expand=["inference"])
+            except HfHubHTTPError as e:
+                if getattr(e.response, "status_code", None) in probe_fatal_statuses:
+                    raise
+                log.warning("⚠️ Hub model check failed, continuing without it: %s", e)
+            except requests.RequestException as e:  # timeouts and connection drops
+                log.warning("⚠️ Hub model check failed, continuing without it: %s", e)
+            else:
+                if info.inference != "warm":
+                    # Still usable - the first request waits for a load, which the retry policy covers
+                    log.info("🧊 %s is %s on the Inference API", model_name, info.inference or "not deployed")
+                _remember_probe()
+        client = _get_client()
+        log.info("✅ Client initialized for model: %s", model_name)
+        return client, ready_message
 
     except Exception as e:
-        error_msg = str(e)
-        print(f"❌ Failed to load {model_name}: {error_msg}")
-        print(f"❌ Full exception: {repr(e)}")
-
-        # Give specific error messages
-        if "401" in error_msg or "unauthorized" in error_msg.lower():
-            return None, "❌ Authentication failed. Check your HF_TOKEN in Railway environment variables."
-        elif "403" in error_msg or "forbidden" in error_msg.lower() or "gated" in error_msg.lower():
-            return None, f"❌ Model access denied: {model_name}\n\nYour model appears to be private/gated. To fix this:\n1. Go to https://huggingface.co/{model_name}\n2. Click 'Settings' → 'Visibility' → Make it 'Public'\n3. OR ensure your HF_TOKEN has proper permissions for private models\n4. Refresh this page after changing visibility\n\nFull error: {error_msg}"
-        elif "404" in error_msg or "not found" in error_msg.lower():
-            return None, f"❌ Model not found: {model_name}\n\nThis means your merged model hasn't been created yet. Please:\n1. Run the merge script in Google Colab\n2. Wait for upload to complete\n3. Verify your model exists at: https://huggingface.co/{model_name}"
-        else:
-            return None, f"❌ Error loading your model: {error_msg}\n\nFull error details: {repr(e)}\n\nTroubleshooting:\n1. Verify model exists: https://huggingface.co/{model_name}\n2. Check HF_TOKEN permissions\n3. Make model public or ensure token has private model access\n4. Model might still be processing on HuggingFace (wait 5-10 minutes)\n5. Try the refresh button"
-
-# Initialize your LoRA model
-client, status_message = get_lora_client()
-is_working = client is not None
-
-def generate_response(instruction, input_text="", max_length=400, temperature=0.7):
-    """Generate response using ONLY your trained LoRA model"""
-
-    if not is_working:
-        return f"🚫 Your personalized model isn't available yet.\n\n{status_message}\n\nThis app only works with your trained LoRA model - no generic substitutes!"
-
-    # Format the prompt for your trained model
-    if input_text.strip():
-        prompt = f"### Instruction:\n{instruction}\n\n### Input:\n{input_text}\n\n### Response:\n"
+        log.exception("❌ Failed to load %s", model_name)
+        return None, _load_error_message(e)
+
+def _load_error_message(e):
+    """Turn a model loading/lookup failure into setup guidance"""
+    error_msg = str(e)
+    match = ERROR_RE.search(error_msg)
+    kind = match.lastgroup if match else None
+
+    # Give specific error messages
+    if kind == "auth":
+        return "❌ Authentication failed. Check your HF_TOKEN in Railway environment variables."
+    elif kind == "forbid":
+        return f"❌ Model access denied: {model_name}\n\nYour model appears to be private/gated. To fix this:\n1. Go to https://huggingface.co/{model_name}\n2. Click 'Settings' → 'Visibility' → Make it 'Public'\n3. OR ensure your HF_TOKEN has proper permissions for private models\n4. Refresh this page after changing visibility\n\nFull error: {error_msg}"
+    elif kind == "notfound":
+        return f"❌ Model not found: {model_name}\n\nThis means your merged model hasn't been created yet. Please:\n1. Run the merge script in Google Colab\n2. Wait for upload to complete\n3. Verify your model exists at: https://huggingface.co/{model_name}"
     else:
-        prompt = f"### Instruction:\n{instruction}\n\n### Response:\n"
-
-    try:
-        # Try chat completions API instead
-        messages = [
-            {"role": "user", "content": prompt}
-        ]
-        
+        return f"❌ Error loading your model: {error_msg}\n\nFull error details: {repr(e)}\n\nTroubleshooting:\n1. Verify model exists: https://huggingface.co/{model_name}\n2. Check HF_TOKEN permissions\n3. Make model public or ensure token has private model access\n4. Model might still be processing on HuggingFace (wait 5-10 minutes)\n5. Try the refresh button"
+
+# Initialize your LoRA model in the background so the server binds its port right away
+_executor = ThreadPoolExecutor(max_workers=1)
+_client_future = _executor.submit(get_lora_client)
+
+async def _client_status():
+    """(client, status message) from background init - instant once it has finished"""
+    return await asyncio.wrap_future(_client_future)
+
+def _is_transient(e):
+    """Connection drops, timeouts and 5xx (e.g. 503 while the model loads) are worth retrying; 4xx are not"""
+    # AsyncInferenceClient surfaces HTTP errors as aiohttp's ClientResponseError, not HfHubHTTPError
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500
+    return isinstance(e, (TimeoutError, ConnectionError, InferenceTimeoutError, aiohttp.ClientConnectionError))
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(0.5, 4),
+    retry=retry_if_exception(_is_transient),
+    reraise=True
+)
+async def _call_hf(method, *args, **kwargs):
+    """Call an Inference API method on the shared client, retrying transient failures with backoff"""
+    sessions = []
+    _call_sessions.set(sessions)  # each burst call runs in its own task, so this doesn't leak across calls
+    result = await getattr(_get_client(), method)(*args, **kwargs)
+    if kwargs.get("stream"):
+        return _ClosingStream(result, sessions)
+    return result
+
+def _keep(task):
+    """Hold a strong reference until the task finishes; the event loop only keeps weak ones"""
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+def _close_abandoned(result):
+    """Close a stream nobody will read, so its HTTP session isn't leaked"""
+    if hasattr(result, "aclose"):
+        _keep(asyncio.create_task(result.aclose()))
+
+def _settle(batch, burst):
+    """Hand each call's result or exception back to the request waiting on it"""
+    results = [asyncio.CancelledError()] * len(batch) if burst.cancelled() else burst.result()
+    for (*_, future), result in zip(batch, results):
+        if future.done():  # the caller gave up while we were waiting
+            _close_abandoned(result)
+        elif isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+async def _batcher():
+    """Coalesce calls that arrive within max_batch_delay and send them as one concurrent burst"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + max_batch_delay
+        while len(batch) < max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # The public API has no batch endpoint, but one gather over the shared client
+        # lets the server's continuous batching pick the whole burst up together.
+        # The burst runs on its own so the next one never waits behind a slow call.
+        burst = _keep(asyncio.gather(
+            *(_call_hf(method, *args, **kwargs) for method, args, kwargs, _ in batch),
+            return_exceptions=True
+        ))
+        burst.add_done_callback(functools.partial(_settle, batch))
+
+async def _submit(method, *args, **kwargs):
+    """Hand an Inference API call to the batcher and wait for its result"""
+    global _batch_queue, _batch_task
+    if _batch_task is None or _batch_task.done():
+        _batch_queue = asyncio.Queue()
+        _batch_task = asyncio.create_task(_batcher())
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((method, args, kwargs, future))
+    return await future
+
+async def clear_response_cache():
+    """Forget every cached answer"""
+    await _cache.clear()
+    return "🧹 Response cache cleared"
+
+async def _stream_chat(task, instruction, input_text, max_length, temperature):
+    """Primary path: stream chat_completion deltas through the batcher"""
+    text = ""
+    tokens = 0
+    async with _sem:
+        stream = await _submit(
+            "chat_completion",
+            messages=make_messages(task, instruction, input_text),
+            max_tokens=max_length,
+            temperature=temperature,
+            stop=STOP_SEQUENCES,
+            stream=True
+        )
         try:
-            response = client.chat_completion(
-                messages=messages,
-                max_tokens=max_length,
-                temperature=temperature
-            )
-            
-            if response and hasattr(response, 'choices') and response.choices:
-                return response.choices[0].message.content.strip()
-            elif isinstance(response, dict) and 'choices' in response:
-                return response['choices'][0]['message']['content'].strip()
-            else:
-                return str(response).strip()
-                
-        except Exception as chat_error:
-            print(f"⚠️ Chat completion failed: {chat_error}")
-            # Fallback to basic text generation without problematic parameters
-            response = client.text_generation(
-                prompt,
-                max_new_tokens=min(max_length, 200),  # Reduce max tokens
-                temperature=min(temperature, 0.8),    # Reduce temperature
-                return_full_text=False
-            )
-            
-            if response and len(response.strip()) > 0:
-                return response.strip()
-            else:
-                return "I apologize, but I couldn't generate a response. Please try rephrasing your question."
+            async for chunk in stream:
+                try:
+                    delta = chunk.choices[0].delta.content
+                except (AttributeError, IndexError):  # keep-alive or malformed chunk
+                    continue
+                if delta:
+                    tokens += 1
+                    text += delta
+                    yield text.strip()
+        finally:
+            await stream.aclose()  # ends the HTTP response too when we stop early
+    # Well under max_length means a stop sequence ended generation early
+    log.info("📏 Completion used %d/%d tokens", tokens, max_length)
+
+async def _generate_raw(task, instruction, input_text, max_length, temperature):
+    """Fallback path: stream a raw-template text_generation call without problematic parameters"""
+    text = ""
+    async with _sem:
+        stream = await _submit(
+            "text_generation",
+            build_raw_prompt(task, instruction, input_text),
+            max_new_tokens=min(max_length, 200),  # Reduce max tokens
+            temperature=min(temperature, 0.8),    # Reduce temperature
+            stop_sequences=STOP_SEQUENCES,
+            return_full_text=False,
+            stream=True
+        )
+        try:
+            async for token in stream:
+                text += token
+                if text.strip():
+                    yield text.strip()
+        finally:
+            await stream.aclose()
+
+# Tried in order; the next one only runs if the previous failed before producing any text
+_generation_paths = (_stream_chat, _generate_raw)
+
+async def generate_response(task, instruction, input_text="", max_length=default_max_length, temperature=default_temperature):
+    """Stream a response from ONLY your trained LoRA model, yielding the text so far"""
+
+    # Degenerate input never needs the model
+    question = instruction.strip()
+    if not question:
+        yield "Please enter a question."
+        return
+    # Recommend takes a genre/topic, where "AI" or "Go" is a perfectly good answer
+    if task != TASK_RECOMMEND and len(question) < min_question_chars:
+        yield "Please ask a fuller question."
+        return
+    if len(question) > max_input_chars or len(input_text) > max_input_chars:
+        yield f"Input too long — please shorten to under {max_input_chars} characters."
+        return
+
+    client, status_message = await _client_status()
+    if client is None:
+        # Failures are raised, not yielded, so Gradio's example cache never stores them
+        raise gr.Error(f"🚫 Your personalized model isn't available yet.\n\n{status_message}\n\nThis app only works with your trained LoRA model - no generic substitutes!")
+
+    # Identical requests can reuse an earlier answer - briefly for creative settings, longer
+    # for factual ones. Keys use canonicalized text; the model still gets what the user typed.
+    canon_instruction, canon_input = _cache.canon(instruction), _cache.canon(input_text)
+    temperature_bucket = round(temperature, 1)
+    use_cache = temperature_bucket < uncacheable_temperature
+    if use_cache:
+        cache_key = _cache.make_key(
+            m=model_name, v=app_version, task=task, p=canon_instruction, i=canon_input,
+            t=temperature_bucket, L=max_length
+        )
+        cached = await _cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    # Then a reworded version of an earlier question ("sci-fi book" vs "science fiction")
+    use_semantic = _cache.semantic_enabled and temperature_bucket <= semantic_max_temperature
+    if use_semantic:
+        semantic_text = "\n".join((canon_instruction, canon_input))
+        semantic_scope = (model_name, app_version, task, temperature_bucket, max_length)
+        cached = await asyncio.to_thread(_cache.semantic_get, semantic_text, semantic_scope)
+        if cached is not None:
+            yield cached
+            return
+
+    text = ""
+    try:
+        for path in _generation_paths:
+            stream = path(task, instruction, input_text, max_length, temperature)
+            try:
+                async for text in stream:
+                    text = RESPONSE_HEADER_RE.sub("", text, count=1)
+                    # Stop paying for tokens once the answer has clearly ended
+                    early_stop = EARLY_STOP_RE.search(text)
+                    if early_stop:
+                        text = text[:early_stop.start()].strip()
+                        if text:
+                            yield text
+                        break
+                    yield text
+                break
+            except Exception as path_error:
+                # Only fall through if nothing reached the user yet, otherwise we'd clobber a partial answer
+                if text or path is _generation_paths[-1]:
+                    raise
+                log.warning("⚠️ %s failed, falling back: %s", path.__name__, path_error)
+            finally:
+                # Releases the semaphore and the HTTP stream right away when we stop early
+                await stream.aclose()
+
+        if text:
+            ttl = factual_cache_ttl if temperature_bucket <= factual_temperature else creative_cache_ttl
+            if use_cache:
+                await _cache.put(cache_key, text, ttl)
+            if use_semantic:
+                await asyncio.to_thread(_cache.semantic_put, semantic_text, semantic_scope, text, ttl)
 
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Generation error: {error_msg}")
-        print(f"❌ Full exception: {repr(e)}")
-        return f"❌ Error with your model: {error_msg}\n\nFull error: {repr(e)}\n\nYour LoRA model exists but encountered an error. Try refreshing or check the logs."
+        log.exception("❌ Generation error")
+        # The model may have gone away since it was last checked; re-check on next startup
+        _forget_probe()
+        raise gr.Error(f"❌ Error with your model: {error_msg}\n\nFull error: {repr(e)}\n\nYour LoRA model exists but encountered an error. Try refreshing or check the logs.") from e
+
+    if not text:
+        raise gr.Error("I apologize, but I couldn't generate a response. Please try rephrasing your question.")
 
-def chat_interface(message, history, temperature, max_length):
+async def chat_interface(message, history, temperature, max_length):
     """Chat interface - only your LoRA model"""
-    response = generate_response(
+    async for partial in generate_response(
+        TASK_CHAT,
         instruction=message,
         max_length=max_length,
         temperature=temperature
+    ):
+        yield partial
+
+# Static page text, built once at import rather than inside the Blocks layout
+_HEADER_MD = f"""
+# 📚 Jacob's Personal Book Advisor
+### Trained Exclusively on Your Book Library 🎯
+
+**Model**: `{model_name}`
+"""
+
+_SETUP_MD = f"""
+### 🔧 Setup Required
+
+Your personalized book advisor isn't ready yet. Here's what to do:
+
+#### Debug Information:
+- **Model Name**: `{model_name}`
+- **HF Token**: {"✅ Set" if hf_token else "❌ Missing"} ({hf_token[:10] + "..." if hf_token else "None"})
+- **Model URL**: [Check if model exists](https://huggingface.co/{model_name})
+
+#### If you haven't created the merged model:
+1. **Your LoRA training is complete** (jacobpmeyer/book-advisor-lora exists)
+2. **Run the merge script** in Google Colab (creates the Inference API compatible version)
+3. **Wait for upload** to finish (creates jacobpmeyer/book-advisor-merged)
+4. **Come back here** and refresh the page
+
+#### If merge script is complete:
+1. **Check your model exists**: [https://huggingface.co/{model_name}](https://huggingface.co/{model_name})
+2. **Verify HF_TOKEN** in Railway environment variables
+3. **Check model visibility** (should be public or you have access)
+4. **Wait 5-10 minutes** if model was just uploaded (HuggingFace processing time)
+
+#### Setup Status Check:
+- ✅ Google Colab training completed?
+- ✅ LoRA model uploaded to HuggingFace?
+- ✅ Merge script run successfully?
+- ✅ Merged model visible at the link above?
+- ✅ HF_TOKEN set in Railway?
+
+**This app ONLY works with your trained model - no substitutes!**
+"""
+
+_FOOTER_MD = """
+---
+**🎯 This AI knows YOUR books**: Responses are based exclusively on Jacob's personal library
+**🚫 No generic responses**: Only recommendations and insights from your actual collection
+**⚡ Powered by**: Your custom merged model (LoRA + Llama-3.1-8B-Instruct)
+"""
+
+# The ready status never varies, so only the failure status is formatted per page load
+_STATUS_READY_MD = f"**Status**: {ready_message}\n\nThis AI knows your personal book collection and can provide personalized recommendations and insights!"
+
+def _status_markdown(status_message, is_working):
+    """Status line, filled in once background init finishes"""
+    if is_working:
+        return _STATUS_READY_MD
+    return f"**Status**: {status_message}"
+
+async def _page_state():
+    """Wait for the model, then show either the advisor or the setup help"""
+    client, status_message = await _client_status()
+    is_working = client is not None
+    return (
+        _status_markdown(status_message, is_working),
+        gr.Markdown(visible=not is_working),
+        gr.Column(visible=is_working),
+        status_message
     )
-    return response
 
 # Create the Gradio interface
 with gr.Blocks(
@@ -106,90 +532,50 @@ with gr.Blocks(
     theme=gr.themes.Soft(),
 ) as demo:
 
-    gr.Markdown(f"""
-    # 📚 Jacob's Personal Book Advisor
-    ### Trained Exclusively on Your Book Library 🎯
-
-    **Model**: `{model_name}`
-    **Status**: {status_message}
-
-    {"This AI knows your personal book collection and can provide personalized recommendations and insights!" if is_working else ""}
-    """)
-
-    if not is_working:
-        gr.Markdown(f"""
-        ### 🔧 Setup Required
-
-        Your personalized book advisor isn't ready yet. Here's what to do:
-
-        #### Debug Information:
-        - **Model Name**: `{model_name}`
-        - **HF Token**: {"✅ Set" if hf_token else "❌ Missing"} ({hf_token[:10] + "..." if hf_token else "None"})
-        - **Model URL**: [Check if model exists](https://huggingface.co/{model_name})
+    gr.Markdown(_HEADER_MD)
+    status_md = gr.Markdown("**Status**: ⏳ Warming up your personalized model...")
+    setup_md = gr.Markdown(_SETUP_MD, visible=False)
 
-        #### If you haven't created the merged model:
-        1. **Your LoRA training is complete** (jacobpmeyer/book-advisor-lora exists)
-        2. **Run the merge script** in Google Colab (creates the Inference API compatible version)
-        3. **Wait for upload** to finish (creates jacobpmeyer/book-advisor-merged)
-        4. **Come back here** and refresh the page
+    # Model management
+    with gr.Row():
+        refresh_btn = gr.Button("🔄 Refresh Model Connection", size="sm")
+        clear_cache_btn = gr.Button("🧹 Clear Response Cache", size="sm")
+        model_status = gr.Textbox(
+            value="⏳ Warming up...",
+            label="Model Status",
+            lines=2,
+            interactive=False
+        )
 
-        #### If merge script is complete:
-        1. **Check your model exists**: [https://huggingface.co/{model_name}](https://huggingface.co/{model_name})
-        2. **Verify HF_TOKEN** in Railway environment variables
-        3. **Check model visibility** (should be public or you have access)
-        4. **Wait 5-10 minutes** if model was just uploaded (HuggingFace processing time)
-
-        #### Setup Status Check:
-        - ✅ Google Colab training completed?
-        - ✅ LoRA model uploaded to HuggingFace?
-        - ✅ Merge script run successfully?
-        - ✅ Merged model visible at the link above?
-        - ✅ HF_TOKEN set in Railway?
-
-        **This app ONLY works with your trained model - no substitutes!**
-
-        **Current Error**: {status_message}
-        """)
-
-    else:
-        # Only show the interface if the model is working
-
-        # Model management
-        with gr.Row():
-            refresh_btn = gr.Button("🔄 Refresh Model Connection", size="sm")
-            model_status = gr.Textbox(
-                value=status_message,
-                label="Model Status",
-                lines=2,
-                interactive=False
-            )
-
-        def refresh_model():
-            global client, status_message, is_working
-            client, status_message = get_lora_client()
-            is_working = client is not None
-            return status_message
-
-        refresh_btn.click(refresh_model, outputs=model_status)
+    # Only show the interface once the model is working
+    with gr.Column(visible=False) as advisor_ui:
 
         # Shared controls
         with gr.Row():
-            temperature = gr.Slider(0.1, 1.0, value=0.7, step=0.1, label="Temperature (Creativity)")
-            max_length = gr.Slider(100, 800, value=400, step=50, label="Response Length")
+            temperature = gr.Slider(0.1, 1.0, value=default_temperature, step=0.1, label="Temperature (Creativity)")
+            max_length = gr.Slider(100, 800, value=default_max_length, step=50, label="Response Length")
 
         with gr.Tabs():
             # General Chat Tab
             with gr.TabItem("💬 General Chat"):
+                # Sliders arrive as event inputs, so each session gets its own settings
                 chatbot = gr.ChatInterface(
-                    fn=lambda msg, hist: chat_interface(msg, hist, temperature.value, max_length.value),
+                    fn=chat_interface,
                     type="messages",
+                    additional_inputs=[temperature, max_length],
                     examples=[
-                        "What's the most interesting book in my collection?",
-                        "Tell me about the themes in my library",
-                        "What would you recommend for a rainy weekend?",
-                        "Summarize the key ideas from my philosophy books",
-                        "Which book changed your perspective the most?"
+                        [example, default_temperature, default_max_length]
+                        for example in (
+                            "What's the most interesting book in my collection?",
+                            "Tell me about the themes in my library",
+                            "What would you recommend for a rainy weekend?",
+                            "Summarize the key ideas from my philosophy books",
+                            "Which book changed your perspective the most?"
+                        )
                     ],
+                    # Each example runs once, on its first successful click, and is served from disk after that
+                    cache_examples=True,
+                    cache_mode="lazy",
                     title="Ask me anything about YOUR book library!"
                 )
 
@@ -216,14 +602,14 @@ with gr.Blocks(
                             interactive=False
                         )
 
-                def book_recommendation_interface(genre_or_topic, reading_situation):
-                    instruction = f"Recommend a book from my personal library for someone interested in {genre_or_topic}. Explain why this book from my collection would be perfect."
+                async def book_recommendation_interface(genre_or_topic, reading_situation, temperature, max_length):
                     input_text = f"Reading context: {reading_situation}" if reading_situation else ""
-                    return generate_response(instruction, input_text, temperature.value, max_length.value)
+                    async for partial in generate_response(TASK_RECOMMEND, genre_or_topic, input_text, max_length, temperature):
+                        yield partial
 
                 rec_button.click(
                     fn=book_recommendation_interface,
-                    inputs=[genre_input, situation_input],
+                    inputs=[genre_input, situation_input, temperature, max_length],
                     outputs=recommendation_output
                 )
 
@@ -250,25 +636,36 @@ with gr.Blocks(
                             interactive=False
                         )
 
-                def content_question_interface(question, book_context):
-                    instruction = f"Answer this question based on the content from my personal book library: {question}"
+                async def content_question_interface(question, book_context, temperature, max_length):
                     input_text = f"Focus on: {book_context}" if book_context else ""
-                    return generate_response(instruction, input_text, temperature.value, max_length.value)
+                    async for partial in generate_response(TASK_ANSWER, question, input_text, max_length, temperature):
+                        yield partial
 
                 question_button.click(
                     fn=content_question_interface,
-                    inputs=[question_input, context_input],
+                    inputs=[question_input, context_input, temperature, max_length],
                     outputs=answer_output
                 )
 
-        gr.Markdown(f"""
-        ---
-        **🎯 This AI knows YOUR books**: Responses are based exclusively on Jacob's personal library
-        **🚫 No generic responses**: Only recommendations and insights from your actual collection
-        **⚡ Powered by**: Your custom merged model (LoRA + Llama-3.1-8B-Instruct)
-        """)
+        gr.Markdown(_FOOTER_MD)
+
+    async def refresh_model():
+        global _client_future
+        # Rebuild the client and pool on the next query; streams already running finish on the old ones
+        _reset_client()
+        _forget_probe()
+        _client_future = _executor.submit(get_lora_client)
+        status, setup, advisor, message = await _page_state()
+        return status, setup, advisor, f"🔄 Client reset; next query will rebuild it.\n{message}"
+
+    page_outputs = [status_md, setup_md, advisor_ui, model_status]
+    demo.load(_page_state, outputs=page_outputs)
+    refresh_btn.click(refresh_model, outputs=page_outputs)
+    clear_cache_btn.click(clear_response_cache, outputs=model_status)
 
 # Launch the app
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 7860))
+    # api_open=False keeps direct REST calls from jumping the queue ahead of UI users
+    demo.queue(default_concurrency_limit=queue_concurrency, max_size=max_queue_size, api_open=False)
     demo.launch(server_name="0.0.0.0", server_port=port, share=False)